@@ -1,10 +1,54 @@
+import argparse
+import logging
+import os
+
+from scraper.interfaces.persistence.migrations import Migrator
+from scraper.interfaces.persistence.price_history import (
+    PriceHistoryRepository
+)
 from scraper.interfaces.persistence.rentals import RentalsRepository
-from scraper.domain.rentals.services import RentalsService
-from scraper.infrastructure.db.mysql import MySQLClient, MySQLConnectionData
-from scraper.infrastructure.scrapers.services import SeleniumScraper
+from scraper.domain.rentals.services import RentalsService, SpoolReplayer
+from scraper.domain.scraping.scheduler import RecrawlScheduler
+from scraper.infrastructure.db.mysql import (MySQLClient,
+                                             MySQLConnectionData,
+                                             is_transient_error)
+from scraper.infrastructure.pricing.services import ModelPricingService
+from scraper.infrastructure.scrapers.services import (ScrapyScraper,
+                                                      SeleniumScraper)
+from scraper.infrastructure.spool.sqlite import SQLiteSpool
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon',
+                        action='store_true',
+                        help='continuously recrawl instead of running a '
+                             'single full crawl')
+    parser.add_argument('--requests-per-hour', type=int, default=600)
+    parser.add_argument('--discovery-interval',
+                        type=float,
+                        default=300,
+                        help='seconds between checks for new postings')
+    parser.add_argument('--checkpoint-interval',
+                        type=float,
+                        default=3600,
+                        help='seconds between removals of postings that are '
+                             'no longer listed and refreshes of the price '
+                             'aggregates')
+    parser.add_argument('--scraper',
+                        choices=['selenium', 'scrapy'],
+                        default='selenium')
+    parser.add_argument('--parser-processes',
+                        type=int,
+                        default=0,
+                        help='processes parsing postings, only used by the '
+                             'scrapy scraper')
+    return parser.parse_args()
 
 
 if __name__ == '__main__':
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
     conn_data = MySQLConnectionData('root',
                                     'rootpass',
                                     '127.0.0.1',
@@ -12,6 +56,34 @@ if __name__ == '__main__':
                                     'scraper')
     mysql = MySQLClient(conn_data)
     repo = RentalsRepository(mysql)
-    scraper = SeleniumScraper()
-    service = RentalsService(repo, scraper)
-    service.update_rentals()
+    scraper = (ScrapyScraper(args.parser_processes)
+               if args.scraper == 'scrapy' else SeleniumScraper())
+    model_path = os.environ.get('PRICE_MODEL_PATH', 'price_model.joblib')
+    pricing = (ModelPricingService(model_path)
+               if os.path.exists(model_path) else None)
+    history = PriceHistoryRepository(mysql)
+    spool = SQLiteSpool(os.environ.get('SPOOL_PATH', 'spool.sqlite3'))
+    service = RentalsService(repo, scraper, pricing, history, spool)
+    replayer = SpoolReplayer(spool,
+                             service.replay,
+                             is_transient_error,
+                             Migrator(mysql).migrate)
+    replayer.start()
+
+    if args.daemon:
+        scheduler = RecrawlScheduler(
+            scraper,
+            service.save_rentals,
+            service.close_recrawl,
+            # pymysql connections can't be shared with the replayer's thread
+            RentalsRepository(MySQLClient(conn_data)).find_links,
+            requests_per_hour=args.requests_per_hour,
+            discovery_interval=args.discovery_interval,
+            checkpoint_interval=args.checkpoint_interval
+        )
+        scheduler.run()
+    else:
+        service.update_rentals()
+        replayer.stop(
+            timeout=float(os.environ.get('SPOOL_DRAIN_TIMEOUT', 300))
+        )
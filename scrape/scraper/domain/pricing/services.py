@@ -0,0 +1,11 @@
+from abc import ABC, abstractmethod
+from typing import List
+
+from scraper.domain.rentals.entities import Rental
+
+
+class PricingService(ABC):
+    @abstractmethod
+    def estimate_prices(self, rentals: List[Rental]) -> List[Rental]:
+        """Sets the estimated price of the rentals and the relative gap
+        between it and their actual total price."""
@@ -1,4 +1,8 @@
+import re
 from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional
+from urllib.parse import urlparse
 
 
 @dataclass
@@ -22,3 +26,39 @@ class Rental:
     expenses: float
     link: str
     apartment: Apartment
+    estimated_price: Optional[float] = None
+    price_gap: Optional[float] = None
+    inferred_fields: str = ''
+    cluster_id: Optional[str] = None
+
+    @property
+    def posting_id(self) -> str:
+        return posting_id(self.link)
+
+
+def posting_id(link: str) -> str:
+    """Identifier of a posting in its portal, prefixed with the portal's
+    host so it's unique across portals."""
+    url = urlparse(link)
+    host = url.netloc.replace('www.', '')
+    match = re.search(r'(\d+)(?:\.html)?$', url.path)
+    return f'{host}:{match.group(1) if match else url.path}'
+
+
+@dataclass
+class PriceAggregate:
+    period_start: date
+    dimension: str
+    value: str
+    median_price: float
+    listings: int
+
+
+@dataclass
+class SpoolEntry:
+    sequence: int
+    run_id: str
+    rentals: List[Rental]
+    scraped_at: datetime
+    end_of_run: bool = False
+    posting_ids: Optional[List[str]] = None
@@ -1,7 +1,31 @@
 from abc import ABC, abstractmethod
-from typing import List, Union
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional, Union
 
-from scraper.domain.rentals.entities import Rental
+from scraper.domain.rentals.entities import (PriceAggregate,
+                                             Rental,
+                                             SpoolEntry)
+
+
+@dataclass
+class RentalsQuery:
+    """Filters and ranges to look rentals up by. Unset values are not
+    filtered on."""
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_rooms: Optional[int] = None
+    max_rooms: Optional[int] = None
+    min_surface: Optional[int] = None
+    max_surface: Optional[int] = None
+    min_price_gap: Optional[float] = None
+    has_balcony: Optional[bool] = None
+    has_terrace: Optional[bool] = None
+    has_garage: Optional[bool] = None
+    is_studio_apartment: Optional[bool] = None
+    posting_ids: Optional[List[str]] = None
+    order_by: str = 'price'
+    limit: Optional[int] = None
 
 
 class Repository(ABC):
@@ -9,6 +33,86 @@ class Repository(ABC):
     def save(self, rentals: Union[Rental, List[Rental]]) -> None:
         """Saves the rental(s)."""
 
+    @abstractmethod
+    def find(self, query: Optional[RentalsQuery] = None) -> List[Rental]:
+        """Returns the rentals matching the query."""
+
+    @abstractmethod
+    def find_links(self, query: Optional[RentalsQuery] = None) -> List[str]:
+        """Returns the links of the rentals matching the query."""
+
+    @abstractmethod
+    def retain(self, posting_ids: List[str]) -> None:
+        """Deletes the rentals whose posting ID isn't in `posting_ids`.
+        An empty `posting_ids` deletes nothing."""
+
     @abstractmethod
     def truncate(self) -> None:
         """Deletes all the data."""
+
+
+class HistoryRepository(ABC):
+    @abstractmethod
+    def record(self, rentals: List[Rental], observed_at: datetime) -> int:
+        """Appends the price and expenses of the rentals whose values
+        changed since they were last recorded and returns how many
+        changed."""
+
+    @abstractmethod
+    def refresh_aggregates(
+        self,
+        rentals: List[Rental],
+        observed_at: datetime
+    ) -> None:
+        """Updates the daily and weekly aggregates of the period
+        containing `observed_at` with the given snapshot of rentals."""
+
+    @abstractmethod
+    def aggregates(
+        self,
+        granularity: str,
+        dimension: str,
+        since: Optional[date] = None
+    ) -> List[PriceAggregate]:
+        """Returns the `daily` or `weekly` aggregates of a dimension."""
+
+
+class Spool(ABC):
+    """Durable local buffer of scraped rentals waiting to be saved."""
+
+    @abstractmethod
+    def append(
+        self,
+        run_id: str,
+        rentals: List[Rental],
+        scraped_at: datetime
+    ) -> None:
+        """Durably appends a batch of rentals scraped in a run at
+        `scraped_at`."""
+
+    @abstractmethod
+    def close_run(
+        self,
+        run_id: str,
+        posting_ids: List[str],
+        closed_at: datetime
+    ) -> None:
+        """Appends the marker of the end of a run with the posting IDs of
+        every rental scraped in it."""
+
+    @abstractmethod
+    def peek(self, limit: int) -> List[SpoolEntry]:
+        """Returns the oldest entries, without removing them."""
+
+    @abstractmethod
+    def ack(self, sequence: int) -> None:
+        """Removes the entries up to `sequence` once they're saved."""
+
+    @abstractmethod
+    def dead_letter(self, entry: SpoolEntry, error: str) -> None:
+        """Keeps a copy of an entry that can't be saved, along with the
+        error, so it can be inspected once it's acknowledged."""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of entries waiting to be saved."""
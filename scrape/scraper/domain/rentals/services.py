@@ -1,18 +1,284 @@
-from scraper.domain.rentals.repositories import Repository
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from scraper.domain.pricing.services import PricingService
+from scraper.domain.rentals.entities import Rental, SpoolEntry, posting_id
+from scraper.domain.rentals.repositories import (HistoryRepository,
+                                                 Repository,
+                                                 RentalsQuery,
+                                                 Spool)
 from scraper.domain.scraping.services import ScrapingService
 
+logger = logging.getLogger(__name__)
+
+RECRAWL_RUN_ID = 'recrawl'
+
 
 class RentalsService:
     def __init__(
         self,
         repository: Repository,
-        scraping_service: ScrapingService
+        scraping_service: ScrapingService,
+        pricing_service: Optional[PricingService] = None,
+        history_repository: Optional[HistoryRepository] = None,
+        spool: Optional[Spool] = None
     ) -> None:
         self._repository = repository
         self._scraping_service = scraping_service
+        self._pricing_service = pricing_service
+        self._history_repository = history_repository
+        self._spool = spool
 
     def update_rentals(self) -> None:
-        """Scrape for rentals and update the repository."""
+        """Scrape for rentals and update the repository.
+
+        When there's a spool, scraped batches are appended to it as they
+        come and it's up to a `SpoolReplayer` to save them."""
+        if self._spool is not None:
+            self._spool_rentals()
+            return
+
         rentals = self._scraping_service.scrape_for_rentals()
+        scraped_at = _now()
+        self._estimate_prices(rentals)
         self._repository.truncate()
         self._repository.save(rentals)
+        self._record_history(rentals, scraped_at)
+        self._refresh_aggregates(rentals, scraped_at)
+
+    def save_rentals(self, rentals: List[Rental]) -> None:
+        """Saves recrawled rentals without removing the ones that weren't
+        recrawled."""
+        if self._spool is not None:
+            self._spool.append(RECRAWL_RUN_ID, rentals, _now())
+        else:
+            self._store([(rentals, _now())])
+
+    def close_recrawl(self, links: List[str]) -> None:
+        """Removes the rentals whose posting isn't in `links`, which are
+        no longer listed, and refreshes the aggregates with the rest."""
+        posting_ids = [posting_id(link) for link in links]
+        if self._spool is not None:
+            self._spool.close_run(RECRAWL_RUN_ID, posting_ids, _now())
+            return
+
+        self._repository.retain(posting_ids)
+        self._refresh_aggregates(self._repository.find(), _now())
+
+    def replay(self, entries: List[SpoolEntry]) -> None:
+        """Saves spooled entries in bulk. Saving is keyed by posting ID,
+        so replaying the same entries twice has no further effect.
+
+        History and aggregates are recorded at the time entries were
+        scraped, not replayed, so outages only delay them."""
+        batches = []
+        for entry in entries:
+            if not entry.end_of_run:
+                batches.append((entry.rentals, entry.scraped_at))
+                continue
+
+            self._store(batches)
+            batches = []
+            self._repository.retain(entry.posting_ids)
+            self._refresh_aggregates(self._repository.find(),
+                                     entry.scraped_at)
+        self._store(batches)
+
+    def _spool_rentals(self) -> None:
+        run_id = uuid.uuid4().hex
+        posting_ids = []
+        for rentals in self._scraping_service.iter_rentals():
+            self._spool.append(run_id, rentals, _now())
+            posting_ids += [rental.posting_id for rental in rentals]
+        self._spool.close_run(run_id, posting_ids, _now())
+
+    def _store(self, batches: List[Tuple[List[Rental], datetime]]) -> None:
+        """Saves batches of rentals in bulk, recording the history of each
+        batch at the time it was scraped."""
+        rentals = [rental for batch, _ in batches for rental in batch]
+        if not rentals:
+            return
+
+        self._estimate_prices(rentals)
+        self._repository.save(rentals)
+        for batch, scraped_at in batches:
+            self._record_history(batch, scraped_at)
+
+    def _estimate_prices(self, rentals: List[Rental]) -> None:
+        """Estimates the price of new or changed rentals, reusing the
+        stored estimate of the ones that didn't change. Estimating is
+        optional, so when it fails the rentals are saved without an
+        estimate."""
+        if self._pricing_service is None:
+            return
+
+        query = RentalsQuery(posting_ids=[r.posting_id for r in rentals])
+        stored = {rental.posting_id: rental
+                  for rental in self._repository.find(query)}
+        stale = []
+        for rental in rentals:
+            previous = stored.get(rental.posting_id)
+            if (previous is not None and
+                    previous.estimated_price is not None and
+                    _pricing_key(previous) == _pricing_key(rental)):
+                rental.estimated_price = previous.estimated_price
+                rental.price_gap = previous.price_gap
+            else:
+                stale.append(rental)
+        try:
+            self._pricing_service.estimate_prices(stale)
+        except Exception:
+            logger.exception('Failed to estimate the price of %d rentals',
+                             len(stale))
+            for rental in stale:
+                rental.estimated_price = None
+                rental.price_gap = None
+
+    def _record_history(
+        self,
+        rentals: List[Rental],
+        observed_at: datetime
+    ) -> None:
+        if self._history_repository is None or not rentals:
+            return
+
+        self._history_repository.record(rentals, observed_at)
+
+    def _refresh_aggregates(
+        self,
+        rentals: List[Rental],
+        observed_at: datetime
+    ) -> None:
+        if self._history_repository is None:
+            return
+
+        self._history_repository.refresh_aggregates(rentals, observed_at)
+
+
+class SpoolReplayer:
+    """Drains a spool in the background, passing its entries in batches
+    to `handler`.
+
+    Entries are only removed once `handler` succeeds. Failures for which
+    `is_transient` holds are retried with exponential backoff, so an
+    unavailable database only delays saving. When a batch fails with any
+    other error, its entries are replayed one by one and the ones that
+    still fail are moved to the spool's dead letters, so a bad entry
+    doesn't block the ones after it.
+
+    `prepare`, such as applying the migrations of the database, is
+    retried the same way until it succeeds, before anything is
+    replayed."""
+
+    def __init__(
+        self,
+        spool: Spool,
+        handler: Callable[[List[SpoolEntry]], None],
+        is_transient: Callable[[Exception], bool],
+        prepare: Optional[Callable[[], object]] = None,
+        batch_size: int = 20,
+        interval: float = 1.0,
+        max_backoff: float = 60.0
+    ) -> None:
+        self._spool = spool
+        self._handler = handler
+        self._is_transient = is_transient
+        self._prepare = prepare
+        self._prepared = prepare is None
+        self._batch_size = batch_size
+        self._interval = interval
+        self._max_backoff = max_backoff
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Waits up to `timeout` seconds for the spool to be drained and
+        stops. Returns whether it was fully drained."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def drain(self) -> int:
+        """Saves every spooled entry and returns how many were saved."""
+        if not self._prepared:
+            self._prepare()
+            self._prepared = True
+
+        drained = 0
+        while True:
+            entries = self._spool.peek(self._batch_size)
+            if not entries:
+                return drained
+            try:
+                self._handler(entries)
+            except Exception as error:
+                if self._is_transient(error):
+                    raise
+                logger.exception('Failed to replay %d spooled entries, '
+                                 'replaying them one by one', len(entries))
+                self._replay_each(entries)
+            self._spool.ack(entries[-1].sequence)
+            drained += len(entries)
+
+    def _replay_each(self, entries: List[SpoolEntry]) -> None:
+        for entry in entries:
+            try:
+                self._handler([entry])
+            except Exception as error:
+                if self._is_transient(error):
+                    raise
+                logger.exception('Moving spooled entry %d to the dead '
+                                 'letters', entry.sequence)
+                self._spool.dead_letter(entry, repr(error))
+            self._spool.ack(entry.sequence)
+
+    def _run(self) -> None:
+        backoff = self._interval
+        while True:
+            try:
+                self.drain()
+            except Exception:
+                logger.exception('Failed to replay the spool, retrying in '
+                                 '%.0f seconds', backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+                continue
+
+            if self._stopping.is_set():
+                return
+            backoff = self._interval
+            self._stopping.wait(self._interval)
+
+
+def _now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+def _pricing_key(rental: Rental) -> tuple:
+    apartment = rental.apartment
+    return tuple(_normalize(value) for value in (
+        rental.price,
+        rental.expenses,
+        apartment.total_surface,
+        apartment.covered_surface,
+        apartment.has_balcony,
+        apartment.has_terrace,
+        apartment.has_garage,
+        apartment.is_studio_apartment,
+        apartment.rooms
+    ))
+
+
+def _normalize(value) -> Optional[float]:
+    """Makes values read from the repository comparable with scraped
+    ones, which may be booleans or NaN instead of NULL."""
+    if value is None or value != value:
+        return None
+    return float(value)
@@ -0,0 +1,255 @@
+import heapq
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from scraper.domain.rentals.entities import Rental
+from scraper.domain.scraping.services import (RecrawlableScrapingService,
+                                              RecrawlResult)
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+
+
+@dataclass
+class PostingState:
+    link: str
+    first_seen: float
+    last_fetched: Optional[float] = None
+    fetches: int = 0
+    changes: int = 0
+    misses: int = 0
+    failures: int = 0
+    fingerprint: Optional[tuple] = None
+
+    def priority(self, now: float) -> float:
+        """Value of revisiting the posting now. Postings that were never
+        fetched come first, then the ones that change often, are recent
+        and haven't been fetched for a while. Postings that couldn't be
+        fetched or were delisted the last times back off
+        exponentially."""
+        if self.last_fetched is None:
+            return math.inf
+        change_rate = (self.changes + 1) / (self.fetches + 1)
+        age_days = (now - self.first_seen) / SECONDS_PER_DAY
+        freshness = 1 + 1 / (1 + age_days)
+        hours_since_fetch = (now - self.last_fetched) / SECONDS_PER_HOUR
+        backoff = 2 ** (self.misses + self.failures)
+        return change_rate * freshness * hours_since_fetch / backoff
+
+
+class RecrawlScheduler:
+    """Continuously recrawls postings within a budget of requests per
+    hour.
+
+    Every `discovery_interval` seconds the newest result pages are checked
+    for new postings, and the rest of the budget is spent revisiting the
+    postings with the highest priority that weren't fetched in the last
+    `min_revisit_interval` seconds. Scraped rentals are handed to
+    `on_rentals`.
+
+    Every `checkpoint_interval` seconds, postings the portal said are
+    gone the last `max_misses` times they were fetched are dropped as no
+    longer listed and the links of the rest are handed to
+    `on_checkpoint`. Postings that couldn't be fetched are retried but
+    never dropped, and checkpoints are postponed while ticks have
+    failures, so an outage of the portal doesn't prune anything.
+    Checkpoints also wait until the postings returned by `known_links`
+    are tracked, which is retried every tick, so known postings are never
+    dropped as unseen.
+    """
+
+    def __init__(
+        self,
+        scraping_service: RecrawlableScrapingService,
+        on_rentals: Callable[[List[Rental]], None],
+        on_checkpoint: Callable[[List[str]], None],
+        known_links: Optional[Callable[[], List[str]]] = None,
+        requests_per_hour: int = 600,
+        discovery_interval: float = 300,
+        discovery_pages: int = 1,
+        tick_interval: float = 60,
+        min_revisit_interval: float = 900,
+        checkpoint_interval: float = 3600,
+        max_misses: int = 3,
+        clock: Callable[[], float] = time.time
+    ) -> None:
+        self._scraping_service = scraping_service
+        self._on_rentals = on_rentals
+        self._on_checkpoint = on_checkpoint
+        self._known_links = known_links
+        self._rate = requests_per_hour / SECONDS_PER_HOUR
+        self._capacity = max(1.0, self._rate * tick_interval)
+        self._discovery_interval = discovery_interval
+        self._discovery_pages = discovery_pages
+        self._tick_interval = tick_interval
+        self._min_revisit_interval = min_revisit_interval
+        self._checkpoint_interval = checkpoint_interval
+        self._max_misses = max_misses
+        self._clock = clock
+        self._postings: Dict[str, PostingState] = {}
+        self._tokens = 0.0
+        self._last_refill = clock()
+        self._last_discovery: Optional[float] = None
+        self._last_checkpoint = clock()
+        self._seeded = known_links is None
+
+    def seed(self, links: List[str]) -> None:
+        """Tracks already known postings as if they were just fetched."""
+        now = self._clock()
+        for link in links:
+            self._postings.setdefault(
+                link, PostingState(link, now, last_fetched=now)
+            )
+
+    def run(self) -> None:
+        """Runs forever."""
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                logger.exception('Recrawl tick failed')
+            time.sleep(self._tick_interval)
+
+    def tick(self) -> List[Rental]:
+        """Discovers new postings if it's due and spends the available
+        budget revisiting postings. Returns the scraped rentals."""
+        now = self._clock()
+        self._refill(now)
+        if not self._seeded:
+            self._seed_known_links()
+
+        if (self._last_discovery is None or
+                now - self._last_discovery >= self._discovery_interval):
+            if self._tokens >= self._discovery_pages:
+                self._discover(now)
+
+        due = (state for state in self._postings.values()
+               if state.last_fetched is None or
+               now - state.last_fetched >= self._min_revisit_interval)
+        links = [state.link for state in heapq.nlargest(
+            int(self._tokens),
+            due,
+            key=lambda state: state.priority(now)
+        )]
+        self._tokens -= len(links)
+        result = self._scrape(links) if links else RecrawlResult()
+        failures = self._update_states(links, result, now)
+        if result.rentals:
+            self._on_rentals(result.rentals)
+
+        if (self._seeded and
+                now - self._last_checkpoint >= self._checkpoint_interval):
+            if failures:
+                logger.warning('Postponing the checkpoint, %d postings '
+                               'couldn\'t be fetched', failures)
+            else:
+                self._checkpoint(now)
+        return result.rentals
+
+    def _seed_known_links(self) -> None:
+        try:
+            self.seed(self._known_links())
+        except Exception:
+            logger.exception('Could not load the known postings, retrying '
+                             'on the next tick')
+            return
+        self._seeded = True
+
+    def _checkpoint(self, now: float) -> None:
+        stale = [link for link, state in self._postings.items()
+                 if state.misses >= self._max_misses]
+        for link in stale:
+            del self._postings[link]
+        links = list(self._postings)
+        self._last_checkpoint = now
+        if not links:
+            return
+
+        self._scraping_service.retain_postings(links)
+        self._on_checkpoint(links)
+        logger.info('Dropped %d postings that are no longer listed',
+                    len(stale))
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._tokens = min(self._capacity,
+                           self._tokens + elapsed * self._rate)
+        self._last_refill = now
+
+    def _discover(self, now: float) -> None:
+        links = self._scraping_service.discover_links(self._discovery_pages)
+        self._tokens -= self._discovery_pages
+        self._last_discovery = now
+        new_links = [link for link in links if link not in self._postings]
+        for link in new_links:
+            self._postings[link] = PostingState(link, now)
+        logger.info('Discovered %d new postings', len(new_links))
+
+    def _scrape(self, links: List[str]) -> RecrawlResult:
+        """Scrapes the postings in one go, falling back to scraping them
+        one by one if that fails so a bad posting doesn't block the rest.
+        The postings that still fail are missing from the result."""
+        try:
+            return self._scraping_service.scrape_postings(links)
+        except Exception:
+            logger.exception('Failed to recrawl %d postings, recrawling them '
+                             'one by one', len(links))
+
+        result = RecrawlResult()
+        for link in links:
+            try:
+                posting = self._scraping_service.scrape_postings([link])
+            except Exception:
+                logger.exception('Failed to recrawl %s', link)
+                continue
+            result.rentals += posting.rentals
+            result.scraped += posting.scraped
+            result.delisted += posting.delisted
+        return result
+
+    def _update_states(
+        self,
+        links: List[str],
+        result: RecrawlResult,
+        now: float
+    ) -> int:
+        """Updates the states of the recrawled postings and returns how
+        many couldn't be fetched."""
+        fingerprints = {rental.link: _fingerprint(rental)
+                        for rental in result.rentals}
+        scraped, delisted = set(result.scraped), set(result.delisted)
+        failures = 0
+        for link in links:
+            state = self._postings[link]
+            state.last_fetched = now
+            if link in delisted:
+                state.misses += 1
+                continue
+            if link not in scraped:
+                state.failures += 1
+                failures += 1
+                continue
+
+            state.fetches += 1
+            state.misses = state.failures = 0
+            fingerprint = fingerprints.get(link)
+            if fingerprint is None:
+                continue
+            if (state.fingerprint is not None and
+                    fingerprint != state.fingerprint):
+                state.changes += 1
+            state.fingerprint = fingerprint
+        return failures
+
+
+def _fingerprint(rental: Rental) -> tuple:
+    return tuple(None if value != value else value
+                 for value in (rental.price,
+                               rental.expenses,
+                               rental.title,
+                               rental.description))
@@ -1,10 +1,47 @@
 from abc import ABC, abstractmethod
-from typing import List
+from dataclasses import dataclass, field
+from typing import Iterator, List
 
 from scraper.domain.rentals.entities import Rental
 
 
+@dataclass
+class RecrawlResult:
+    """Outcome of recrawling postings. `scraped` has the links of every
+    posting that was fetched, including the ones postprocessing dropped,
+    and `delisted` the ones the portal said are gone. Postings in neither
+    couldn't be fetched."""
+    rentals: List[Rental] = field(default_factory=list)
+    scraped: List[str] = field(default_factory=list)
+    delisted: List[str] = field(default_factory=list)
+
+
 class ScrapingService(ABC):
     @abstractmethod
     def scrape_for_rentals(self) -> List[Rental]:
         """Scrape for rentals."""
+
+    def iter_rentals(self, batch_size: int = 50) -> Iterator[List[Rental]]:
+        """Scrape for rentals, yielding them in batches."""
+        rentals = self.scrape_for_rentals()
+        for start in range(0, len(rentals), batch_size):
+            yield rentals[start:start + batch_size]
+
+
+class RecrawlableScrapingService(ScrapingService):
+    """Scraping service that can also look for new postings and scrape
+    given postings, so postings can be recrawled one by one."""
+
+    @abstractmethod
+    def discover_links(self, pages: int = 1) -> List[str]:
+        """Returns the links of the postings in the first `pages` result
+        pages, newest first."""
+
+    @abstractmethod
+    def scrape_postings(self, links: List[str]) -> RecrawlResult:
+        """Scrape the rentals of the given postings."""
+
+    @abstractmethod
+    def retain_postings(self, links: List[str]) -> None:
+        """Forgets what's kept about the postings that aren't in `links`,
+        which are no longer listed. An empty `links` forgets nothing."""
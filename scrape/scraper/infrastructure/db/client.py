@@ -1,7 +1,26 @@
 from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional, Sequence
 
 
 class DatabaseClient(ABC):
     @abstractmethod
-    def execute(self, query: str) -> None:
+    def execute(self, query: str, args: Optional[Sequence] = None) -> None:
         """Executes a query with no result."""
+
+    @abstractmethod
+    def fetch_all(
+        self,
+        query: str,
+        args: Optional[Sequence] = None
+    ) -> List[dict]:
+        """Executes a query and returns every row as a dictionary."""
+
+    @abstractmethod
+    def stream(
+        self,
+        query: str,
+        args: Optional[Sequence] = None,
+        batch_size: int = 10_000
+    ) -> Iterator[Dict[str, list]]:
+        """Executes a query and yields its rows in columnar batches without
+        buffering the whole result."""
@@ -1,10 +1,15 @@
 from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence
 
 import pymysql
 import pymysql.cursors
 
 from scraper.infrastructure.db.client import DatabaseClient
 
+# can't connect, server gone away, lost connection, lock wait timeout and
+# deadlock, which succeed when retried
+TRANSIENT_ERRNOS = {2003, 2006, 2013, 1205, 1213}
+
 
 @dataclass
 class MySQLConnectionData:
@@ -17,13 +22,64 @@ class MySQLConnectionData:
 
 class MySQLClient(DatabaseClient):
     def __init__(self, connection_data: MySQLConnectionData) -> None:
-        self._connection = pymysql.connect(
-            **connection_data.__dict__,
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        self._connection_data = connection_data
+        self._pymysql_connection = None
+
+    @property
+    def _connection(self) -> pymysql.connections.Connection:
+        """Connection to the database, which is (re)opened when it's
+        used so the client outlives database outages."""
+        if self._pymysql_connection is None:
+            self._pymysql_connection = pymysql.connect(
+                **self._connection_data.__dict__,
+                cursorclass=pymysql.cursors.DictCursor
+            )
+        else:
+            self._pymysql_connection.ping(reconnect=True)
+        return self._pymysql_connection
 
-    def execute(self, query: str) -> None:
+    def execute(self, query: str, args: Optional[Sequence] = None) -> None:
         """Executes a query with no result."""
+        connection = self._connection
+        with connection.cursor() as cursor:
+            cursor.execute(query, args)
+        connection.commit()
+
+    def fetch_all(
+        self,
+        query: str,
+        args: Optional[Sequence] = None
+    ) -> List[dict]:
+        """Executes a query and returns every row as a dictionary."""
         with self._connection.cursor() as cursor:
-            cursor.execute(query)
-        self._connection.commit()
+            cursor.execute(query, args)
+            return cursor.fetchall()
+
+    def stream(
+        self,
+        query: str,
+        args: Optional[Sequence] = None,
+        batch_size: int = 10_000
+    ) -> Iterator[Dict[str, list]]:
+        """Executes a query on an unbuffered server-side cursor and yields
+        its rows in columnar batches of at most `batch_size` rows.
+
+        The connection can't be used for anything else until the
+        iterator is exhausted or closed."""
+        with self._connection.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(query, args)
+            columns = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield dict(zip(columns, map(list, zip(*rows))))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a query that failed with `error` may succeed when retried.
+    Other errors, such as unknown columns, fail every time."""
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    return (isinstance(error, pymysql.err.OperationalError) and
+            bool(error.args) and error.args[0] in TRANSIENT_ERRNOS)
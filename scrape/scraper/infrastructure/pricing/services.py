@@ -0,0 +1,83 @@
+from functools import lru_cache
+from typing import List
+
+import joblib
+import pandas as pd
+
+from scraper.domain.pricing.services import PricingService
+from scraper.domain.rentals.entities import Rental
+
+FEATURE_COLUMNS = ['total_surface',
+                   'covered_surface',
+                   'has_balcony',
+                   'has_terrace',
+                   'has_balcony_and_terrace',
+                   'rooms',
+                   'is_studio_apartment',
+                   'has_garage']
+
+
+@lru_cache(maxsize=None)
+def load_model(path: str) -> dict:
+    """Loads a serialized model along with the values learned while
+    training it. Models are loaded once per process."""
+    return joblib.load(path)
+
+
+class ModelPricingService(PricingService):
+    """Estimates rental prices with the pipeline trained in the modeling
+    notebook, which predicts the total price (price plus expenses).
+    Missing expenses are imputed with the expenses ratio learned while
+    training, which is saved next to the pipeline."""
+
+    def __init__(self, model_path: str) -> None:
+        self._model_path = model_path
+
+    def estimate_prices(self, rentals: List[Rental]) -> List[Rental]:
+        """Sets the estimated price of the rentals and the relative gap
+        between it and their actual total price."""
+        if not rentals:
+            return rentals
+
+        model = load_model(self._model_path)
+        data = self._to_frame(rentals, model['expenses_ratio'])
+        estimated = model['model'].predict(data.loc[:, FEATURE_COLUMNS])
+        total_price = data['price'] + data['expenses']
+        gap = (estimated - total_price) / total_price
+
+        for rental, estimate, rental_gap in zip(rentals, estimated, gap):
+            rental.estimated_price = float(estimate)
+            rental.price_gap = float(rental_gap)
+        return rentals
+
+    def _to_frame(
+        self,
+        rentals: List[Rental],
+        expenses_ratio: float
+    ) -> pd.DataFrame:
+        data = pd.DataFrame.from_records([
+            {'price': r.price,
+             'expenses': r.expenses,
+             'total_surface': r.apartment.total_surface,
+             'covered_surface': r.apartment.covered_surface,
+             'has_balcony': r.apartment.has_balcony,
+             'has_terrace': r.apartment.has_terrace,
+             'rooms': r.apartment.rooms,
+             'is_studio_apartment': r.apartment.is_studio_apartment,
+             'has_garage': r.apartment.has_garage}
+            for r in rentals
+        ]).astype(float)
+        data.loc[:, 'has_balcony_and_terrace'] = (data['has_balcony'] *
+                                                  data['has_terrace'])
+        return self._impute_expenses(data, expenses_ratio)
+
+    def _impute_expenses(
+        self,
+        data: pd.DataFrame,
+        expenses_ratio: float
+    ) -> pd.DataFrame:
+        """Imputes the expenses by using the median ratio of expenses
+        against total price of the training data."""
+        mask = data['expenses'].notna()
+        data.loc[~mask, 'expenses'] = data.loc[~mask, 'price'] * expenses_ratio
+        return data
@@ -0,0 +1,280 @@
+import math
+import re
+import sqlite3
+import zlib
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from scraper.infrastructure.scrapers.config import SCRAPER_PATH
+
+INDEX_PATH = f'{SCRAPER_PATH}/near_duplicates.sqlite3'
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+BlockKey = Tuple[int, int, int]
+
+
+class MinHasher:
+    """Computes MinHash signatures over word shingles of a text."""
+
+    def __init__(self,
+                 num_perm: int = 128,
+                 shingle_size: int = 3,
+                 seed: int = 1) -> None:
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, _MAX_HASH, num_perm,
+                                    dtype=np.uint64)
+        self._b = generator.randint(0, _MAX_HASH, num_perm,
+                                    dtype=np.uint64)
+
+    def shingles(self, text: str) -> Set[str]:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        if len(tokens) < self.shingle_size:
+            return {' '.join(tokens)} if tokens else set()
+        return {' '.join(tokens[i:i + self.shingle_size])
+                for i in range(len(tokens) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in self.shingles(text)),
+            dtype=np.uint64
+        )
+        if not len(hashes):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        permuted = ((np.outer(self._a, hashes) + self._b[:, None])
+                    % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=1)
+
+
+class NearDuplicateIndex:
+    """Incremental LSH index that groups near-duplicate listings into
+    clusters.
+
+    Listings are first blocked by rooms, surface and price buckets, then
+    the MinHash signature of their text is split into bands and each band
+    is hashed into a bucket. Only listings sharing a bucket in the same or
+    a neighbouring block are compared, so matching a listing only reads
+    its candidates. The index is kept in a SQLite database and written
+    incrementally, so clusters are stable across runs, and listings that
+    are no longer listed are evicted with `retain`.
+
+    The listing kept as the representative of each cluster is tracked,
+    so duplicates of listings kept in earlier batches are dropped too.
+    """
+
+    def __init__(self,
+                 path: str = INDEX_PATH,
+                 num_perm: int = 128,
+                 bands: int = 32,
+                 threshold: float = 0.7,
+                 surface_step: int = 5,
+                 price_ratio: float = 1.05) -> None:
+        if num_perm % bands:
+            raise ValueError('num_perm must be divisible by bands')
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.surface_step = surface_step
+        self.price_ratio = price_ratio
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(
+            """CREATE TABLE IF NOT EXISTS listings (
+                key TEXT PRIMARY KEY,
+                cluster TEXT NOT NULL,
+                block TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                kept INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS listings_cluster
+                ON listings (cluster);
+            CREATE TABLE IF NOT EXISTS buckets (
+                band BLOB NOT NULL,
+                block TEXT NOT NULL,
+                key TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS buckets_band
+                ON buckets (band, block);
+            CREATE INDEX IF NOT EXISTS buckets_key ON buckets (key);"""
+        )
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM listings'
+        ).fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def cluster_of(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            'SELECT cluster FROM listings WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def claim(self, key: str) -> bool:
+        """Keeps the listing as the representative of its cluster unless
+        another listing of the cluster is kept, and returns whether it's
+        kept."""
+        with self._connection:
+            taken = self._connection.execute(
+                'SELECT 1 FROM listings WHERE kept AND key != ? AND cluster = '
+                '(SELECT cluster FROM listings WHERE key = ?)',
+                (key, key)
+            ).fetchone() is not None
+            self._connection.execute(
+                'UPDATE listings SET kept = ? WHERE key = ?',
+                (int(not taken), key)
+            )
+        return not taken
+
+    def release(self, keys: Optional[Iterable[str]] = None) -> None:
+        """Stops keeping the listings as representatives, or every listing
+        when `keys` isn't given, so their clusters pick another one."""
+        with self._connection:
+            if keys is None:
+                self._connection.execute('UPDATE listings SET kept = 0')
+                return
+            self._connection.executemany(
+                'UPDATE listings SET kept = 0 WHERE key = ?',
+                [(key,) for key in keys]
+            )
+
+    def add(self, key: str, text: str, rooms, surface, price) -> str:
+        """Adds a listing to the index and returns its cluster ID."""
+        with self._connection:
+            return self._add(key, text, rooms, surface, price)
+
+    def add_many(self, listings: Iterable[tuple]) -> List[str]:
+        """Adds (key, text, rooms, surface, price) tuples and returns the
+        cluster ID of each one."""
+        with self._connection:
+            return [self._add(*listing) for listing in listings]
+
+    def retain(self, keys: Iterable[str]) -> int:
+        """Evicts the listings whose key isn't in `keys` and returns how
+        many were evicted. An empty `keys` is taken as nothing having been
+        scraped, not as everything being delisted, so nothing is evicted.
+        """
+        keys = list(keys)
+        if not keys:
+            return 0
+
+        with self._connection:
+            self._connection.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS listed '
+                '(key TEXT PRIMARY KEY)'
+            )
+            self._connection.execute('DELETE FROM listed')
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO listed (key) VALUES (?)',
+                [(key,) for key in keys]
+            )
+            self._connection.execute(
+                'DELETE FROM buckets WHERE key NOT IN (SELECT key FROM listed)'
+            )
+            return self._connection.execute(
+                'DELETE FROM listings '
+                'WHERE key NOT IN (SELECT key FROM listed)'
+            ).rowcount
+
+    def _add(self, key: str, text: str, rooms, surface, price) -> str:
+        signature = self.hasher.signature(text)
+        block = self._block_key(rooms, surface, price)
+        cluster = (self.cluster_of(key) or
+                   self._find_cluster(key, signature, block) or
+                   key)
+
+        self._connection.execute(
+            'INSERT INTO listings (key, cluster, block, signature) '
+            'VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'block = excluded.block, signature = excluded.signature',
+            (key, cluster, _encode_block(block), signature.tobytes())
+        )
+        self._connection.execute('DELETE FROM buckets WHERE key = ?', (key,))
+        self._connection.executemany(
+            'INSERT INTO buckets (band, block, key) VALUES (?, ?, ?)',
+            ((band, _encode_block(block), key)
+             for band in self._bands(signature))
+        )
+        return cluster
+
+    def _find_cluster(self,
+                      key: str,
+                      signature: np.ndarray,
+                      block: BlockKey) -> Optional[str]:
+        blocks = [_encode_block(b) for b in self._neighbour_blocks(block)]
+        bands = list(self._bands(signature))
+        candidates = self._connection.execute(
+            'SELECT DISTINCT listings.cluster, listings.signature '
+            'FROM buckets JOIN listings ON listings.key = buckets.key '
+            f'WHERE buckets.block IN ({", ".join(["?"] * len(blocks))}) '
+            f'AND buckets.band IN ({", ".join(["?"] * len(bands))}) '
+            'AND buckets.key != ?',
+            (*blocks, *bands, key)
+        ).fetchall()
+
+        best, best_similarity = None, self.threshold
+        for cluster, candidate in candidates:
+            similarity = float(
+                (np.frombuffer(candidate, dtype=np.uint64) == signature).mean()
+            )
+            if similarity >= best_similarity:
+                best, best_similarity = cluster, similarity
+        return best
+
+    def _bands(self, signature: np.ndarray) -> Iterable[bytes]:
+        for band in range(self.bands):
+            start = band * self.rows
+            yield bytes([band]) + signature[start:start + self.rows].tobytes()
+
+    def _block_key(self, rooms, surface, price) -> BlockKey:
+        rooms = -1 if pd.isna(rooms) else int(rooms)
+        surface = (-1 if pd.isna(surface)
+                   else int(surface) // self.surface_step)
+        price = (-1 if pd.isna(price) or price <= 0
+                 else int(math.log(price) / math.log(self.price_ratio)))
+        return rooms, surface, price
+
+    def _neighbour_blocks(self, block: BlockKey) -> Iterable[BlockKey]:
+        rooms, surface, price = block
+        surfaces = [surface] if surface < 0 else [surface - 1,
+                                                  surface,
+                                                  surface + 1]
+        prices = [price] if price < 0 else [price - 1, price, price + 1]
+        for s in surfaces:
+            for p in prices:
+                yield rooms, s, p
+
+
+def _encode_block(block: BlockKey) -> str:
+    return ':'.join(map(str, block))
+
+
+def listing_text(row: pd.Series) -> str:
+    extras = row['extras'] if isinstance(row['extras'], list) else []
+    return ' '.join([row['title'] or '',
+                     row['description'] or '',
+                     ' '.join(extras)])
+
+
+def assign_clusters(data: pd.DataFrame,
+                    index: NearDuplicateIndex) -> pd.Series:
+    """Adds every listing to the index and returns their cluster IDs."""
+    if data.empty:
+        return pd.Series(dtype=object, index=data.index)
+    data = data.fillna({'title': '', 'description': ''})
+    listings = zip(data['link'],
+                   data.apply(listing_text, axis=1),
+                   data['rooms'],
+                   data['total_surface'],
+                   data['price'])
+    return pd.Series(index.add_many(listings), index=data.index)
@@ -0,0 +1,65 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from scrapy.http import Request, Response
+
+
+class PortalAdapter(ABC):
+    """Knows how to crawl the rental listings of a portal.
+
+    Adapters find the postings in result pages, paginate and extract
+    postings into the same item schema, so every portal can be crawled by
+    the same spider.
+    """
+
+    name: str
+    base_url: str
+    requires_challenge: bool = False
+
+    @abstractmethod
+    def start_urls(self) -> List[str]:
+        """URLs of the first result pages."""
+
+    def newest_urls(self) -> List[str]:
+        """URLs of the first result pages sorted by newest postings. The
+        start URLs are used for portals that can't sort them."""
+        return self.start_urls()
+
+    @abstractmethod
+    def posting_urls(self, response: Response) -> List[str]:
+        """URLs of the postings in a result page."""
+
+    @abstractmethod
+    def next_page_url(
+        self,
+        response: Response,
+        page_number: int
+    ) -> Optional[str]:
+        """URL of the result page `page_number`, if the current page has a
+        next one."""
+
+    @abstractmethod
+    def parse_posting(self, response: Response) -> dict:
+        """Extracts the item of a posting."""
+
+    def solve_challenge(self, request: Request) -> Optional[Response]:
+        """Downloads a request that needs to get past an anti-bot
+        challenge. Only called, from a download thread, when
+        `requires_challenge` is set. Returning None downloads the request
+        as usual."""
+        return None
+
+    def _make_item(self, response: Response, **fields) -> dict:
+        item = {'title': None,
+                'description': '',
+                'extras': [],
+                'price': None,
+                'expenses': None,
+                'location': '',
+                'link': response.url,
+                'total_surface': None,
+                'covered_surface': None,
+                'rooms': None}
+        item.update(fields)
+        return item
+
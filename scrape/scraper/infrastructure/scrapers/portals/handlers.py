@@ -0,0 +1,25 @@
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.threads import deferToThread
+
+
+class PortalDownloadHandler(HTTP11DownloadHandler):
+    """Lets the adapter of the request's portal download it when the
+    portal needs to get past an anti-bot challenge.
+
+    Download handlers run once the request got a download slot, so those
+    requests are still subject to the per-domain concurrency and
+    autothrottle. Adapters download in a thread, so solving challenges
+    doesn't block the reactor.
+    """
+
+    async def download_request(self, request):
+        adapters = getattr(self.crawler.spider, 'adapters', {})
+        adapter = adapters.get(request.meta.get('portal'))
+        if adapter is not None and adapter.requires_challenge:
+            response = await maybe_deferred_to_future(
+                deferToThread(adapter.solve_challenge, request)
+            )
+            if response is not None:
+                return response
+        return await super().download_request(request)
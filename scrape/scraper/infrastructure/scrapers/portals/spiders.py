@@ -0,0 +1,207 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Type
+from urllib.parse import urlparse
+
+import scrapy
+from scrapy import signals
+from scrapy.http import HtmlResponse
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet.defer import Deferred
+
+from scraper.infrastructure.scrapers.config import SCRAPER_PATH
+from scraper.infrastructure.scrapers.portals.adapters import PortalAdapter
+from scraper.infrastructure.scrapers.portals.zonaprop import ZonapropAdapter
+
+# statuses portals answer postings that are no longer listed with
+DELISTED_STATUSES = [404, 410]
+
+
+def portal_settings(name: str) -> dict:
+    """Settings of a spider crawling portals. All of its portals share the
+    downloader, so concurrency, HTTP cache and autothrottle apply to the
+    whole crawl while each portal still gets its own download slot.
+    Challenge pages and server errors aren't cached."""
+    handler = ('scraper.infrastructure.scrapers.portals.handlers.'
+               'PortalDownloadHandler')
+    return {
+        'FEEDS': {
+            f'{SCRAPER_PATH}/{name}_data.json': {
+                'format': 'json',
+                'encoding': 'utf8',
+                'overwrite': True
+            }
+        },
+        'DOWNLOAD_HANDLERS': {'http': handler, 'https': handler},
+        'CONCURRENT_REQUESTS': 32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
+        'AUTOTHROTTLE_ENABLED': True,
+        'AUTOTHROTTLE_TARGET_CONCURRENCY': 2.0,
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_EXPIRATION_SECS': 3600,
+        'HTTPCACHE_IGNORE_HTTP_CODES': [403, 429, 500, 502, 503, 504],
+        'HTTPCACHE_DIR': f'{SCRAPER_PATH}/httpcache'
+    }
+
+
+@lru_cache(maxsize=None)
+def _worker_adapter(adapter_class: Type[PortalAdapter]) -> PortalAdapter:
+    return adapter_class()
+
+
+def parse_posting_body(
+    adapter_class: Type[PortalAdapter],
+    url: str,
+    body: bytes,
+    headers: dict
+) -> dict:
+    """Parses the raw body of a posting in a parser process. The body's
+    encoding is only detected and decoded here, never on the reactor
+    thread."""
+    response = HtmlResponse(url, body=body, headers=headers)
+    return _worker_adapter(adapter_class).parse_posting(response)
+
+
+class PortalSpider(scrapy.Spider):
+    """Crawls every portal with an adapter in `adapter_classes`
+    concurrently, yielding items with the same schema.
+
+    When the `PARSER_PROCESSES` setting is set, postings are parsed by a
+    pool of that many processes so parsing scales with cores and the
+    reactor is left free for downloads. Workers are started by a fork
+    server, since forking the crawler's threads could deadlock them.
+
+    For recrawling, `links` makes it only scrape the given postings, and
+    `discover_pages` makes it only yield the links of the postings in
+    that many of the newest result pages. Those pages aren't cached, and
+    recrawled postings that are no longer listed are yielded as items
+    with only their link and `delisted` set."""
+    name = 'portals'
+    adapter_classes = [ZonapropAdapter]
+    custom_settings = portal_settings(name)
+
+    def __init__(
+        self,
+        *args,
+        links: Optional[List[str]] = None,
+        discover_pages: Optional[int] = None,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.adapters = {adapter_class.name: adapter_class()
+                         for adapter_class in self.adapter_classes}
+        self.links = links
+        self.discover_pages = discover_pages
+        self._parser_pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        processes = crawler.settings.getint('PARSER_PROCESSES', 0)
+        if processes > 0:
+            spider._parser_pool = ProcessPoolExecutor(
+                processes,
+                mp_context=multiprocessing.get_context('forkserver')
+            )
+            crawler.signals.connect(spider._close_parser_pool,
+                                    signal=signals.spider_closed)
+        return spider
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        if self.links is not None:
+            yield from self._posting_requests(self.links)
+            return
+
+        for adapter in self.adapters.values():
+            urls = (adapter.newest_urls() if self.discover_pages
+                    else adapter.start_urls())
+            for url in urls:
+                yield scrapy.Request(url,
+                                     callback=self.parse,
+                                     meta={'portal': adapter.name,
+                                           'page_number': 1,
+                                           'dont_cache': self._recrawling})
+
+    def parse(self, response):
+        portal = response.meta['portal']
+        adapter = self.adapters[portal]
+        if self.discover_pages:
+            for url in adapter.posting_urls(response):
+                yield {'link': url}
+        else:
+            yield from response.follow_all(adapter.posting_urls(response),
+                                           self.parse_posting,
+                                           meta={'portal': portal})
+
+        page_number = response.meta['page_number'] + 1
+        if self.discover_pages and page_number > self.discover_pages:
+            return
+        next_page = adapter.next_page_url(response, page_number)
+        if next_page:
+            yield scrapy.Request(next_page,
+                                 callback=self.parse,
+                                 meta={'portal': portal,
+                                       'page_number': page_number,
+                                       'dont_cache': self._recrawling})
+
+    async def parse_posting(self, response):
+        if response.status in DELISTED_STATUSES:
+            yield {'link': response.url, 'delisted': True}
+            return
+
+        adapter = self.adapters[response.meta['portal']]
+        if self._parser_pool is None:
+            yield adapter.parse_posting(response)
+            return
+
+        future = self._parser_pool.submit(parse_posting_body,
+                                          type(adapter),
+                                          response.url,
+                                          response.body,
+                                          dict(response.headers))
+        yield await maybe_deferred_to_future(_to_deferred(future))
+
+    @property
+    def _recrawling(self) -> bool:
+        return self.links is not None or bool(self.discover_pages)
+
+    def _posting_requests(self, links: List[str]):
+        hosts = {urlparse(adapter.base_url).netloc: adapter
+                 for adapter in self.adapters.values()}
+        for link in links:
+            adapter = hosts.get(urlparse(link).netloc)
+            if adapter is None:
+                self.logger.warning('No portal adapter for %s', link)
+                continue
+            yield scrapy.Request(link,
+                                 callback=self.parse_posting,
+                                 meta={'portal': adapter.name,
+                                       'dont_cache': True,
+                                       'handle_httpstatus_list':
+                                           DELISTED_STATUSES})
+
+    def _close_parser_pool(self, spider):
+        self._parser_pool.shutdown()
+
+
+def _to_deferred(future: Future) -> Deferred:
+    """Deferred fired in the reactor thread when the future is done."""
+    from twisted.internet import reactor
+
+    deferred = Deferred()
+
+    def resolve(done: Future) -> None:
+        if done.exception() is not None:
+            deferred.errback(done.exception())
+        else:
+            deferred.callback(done.result())
+
+    future.add_done_callback(
+        lambda done: reactor.callFromThread(resolve, done)
+    )
+    return deferred
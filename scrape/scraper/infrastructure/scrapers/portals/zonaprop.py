@@ -0,0 +1,142 @@
+import re
+import threading
+from typing import List, Optional
+
+import cloudscraper
+from scrapy.http import Request, Response
+from scrapy.responsetypes import responsetypes
+
+from scraper.infrastructure.scrapers.portals.adapters import PortalAdapter
+from scraper.infrastructure.scrapers.utils import normalize_html_string
+
+ZONAPROP_URL = 'https://www.zonaprop.com.ar'
+BASE_URL = f'{ZONAPROP_URL}/departamentos-alquiler-nueva-cordoba.html'
+NEWEST_URL = BASE_URL.replace('.html', '-orden-publicado-descendente.html')
+# requests already decoded the body, so these no longer apply to it
+DECODED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class ZonapropAdapter(PortalAdapter):
+    name = 'zonaprop'
+    base_url = ZONAPROP_URL
+    requires_challenge = True
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def start_urls(self) -> List[str]:
+        return [BASE_URL]
+
+    def newest_urls(self) -> List[str]:
+        return [NEWEST_URL]
+
+    def posting_urls(self, response: Response) -> List[str]:
+        xpath = '//a[contains(@class, "go-to-posting")]/@href'
+        return [f'{ZONAPROP_URL}{endpoint}'
+                for endpoint in response.xpath(xpath).getall()]
+
+    def next_page_url(
+        self,
+        response: Response,
+        page_number: int
+    ) -> Optional[str]:
+        xpath = '//a[contains(@aria-label, "Siguiente página")]'
+        if not response.xpath(xpath):
+            return None
+        return re.sub(r'(-pagina-\d+)?\.html$',
+                      f'-pagina-{page_number}.html',
+                      response.url)
+
+    def parse_posting(self, response: Response) -> dict:
+        return self._make_item(
+            response,
+            title=self._get_title_from_posting(response),
+            description=self._get_description_from_posting(response),
+            extras=self._get_extras_from_posting(response),
+            price=self._get_price_from_posting(response),
+            expenses=self._get_expenses_from_posting(response),
+            location=self._get_location_from_posting(response),
+            total_surface=self._get_feature_from_posting(response, 'Total'),
+            covered_surface=self._get_feature_from_posting(response,
+                                                           'Cubierta'),
+            rooms=self._get_feature_from_posting(response, 'Ambiente')
+        )
+
+    def solve_challenge(self, request: Request) -> Optional[Response]:
+        """Zonaprop is behind cloudflare, so postings are downloaded with
+        cloudscraper. Each download thread reuses its own session, so the
+        challenge is solved once per thread. The status and headers are
+        kept, so challenge and error pages aren't taken for postings."""
+        scraper = getattr(self._local, 'scraper', None)
+        if scraper is None:
+            scraper = self._local.scraper = cloudscraper.create_scraper()
+        response = scraper.get(request.url,
+                               timeout=request.meta.get('download_timeout',
+                                                        180))
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in DECODED_HEADERS}
+        response_class = responsetypes.from_args(headers=headers,
+                                                 url=request.url,
+                                                 body=response.content)
+        return response_class(request.url,
+                              status=response.status_code,
+                              headers=headers,
+                              body=response.content,
+                              request=request)
+
+    def _get_title_from_posting(self, posting):
+        xpath = ('//section[contains(@class, "article-section-description")]'
+                 '//h1/text()')
+        return posting.xpath(xpath).get()
+
+    def _get_description_from_posting(self, posting):
+        xpath = '//div[@id="longDescription"]/div/text()'
+        return ''.join(posting.xpath(xpath).getall())
+
+    def _get_extras_from_posting(self, posting):
+        xpath = '//div[@id="reactGeneralFeatures"]//ul/li/h4/text()'
+        return [e.strip().lower() for e in posting.xpath(xpath).getall()]
+
+    def _get_price_from_posting(self, posting):
+        xpath = (
+            '//div[contains(@class, "block-price") and '
+            'contains('
+            './/div[contains(@class, "price-operation")], "Alquiler")]'
+            '//div[@class="price-items"]/span/span/text()'
+        )
+        price = posting.xpath(xpath).get()
+        if not price:
+            return price
+        if 'USD' in price:
+            return None
+        try:
+            return float(price.replace('.', '').split(' ')[1])
+        except (IndexError, ValueError):
+            return None
+
+    def _get_expenses_from_posting(self, posting):
+        xpath = '//div[contains(@class, "block-expensas")]/span/text()'
+        expenses = posting.xpath(xpath).get()
+        if not expenses:
+            return expenses
+        if 'USD' in expenses:
+            return None
+        return float(expenses.replace('.', '').split(' ')[1])
+
+    def _get_location_from_posting(self, posting):
+        xpath = '//h2[contains(@class, "title-location")]/node()'
+        location = ''.join(posting.xpath(xpath).getall())
+        if not location:
+            return location
+
+        return normalize_html_string(location)
+
+    def _get_feature_from_posting(self, posting, feature_name):
+        xpath = '//ul[contains(@class, "section-icon-features")]'\
+                f'/li[text()[contains(., "{feature_name}")]]/text()[last()]'
+        feature = posting.xpath(xpath).get()
+        if not feature:
+            return feature
+        feature = normalize_html_string(feature)
+        feature = feature.replace('m²', '').replace(feature_name, '')
+        return int(feature)
@@ -1,15 +1,44 @@
 import os
 import json
+import re
+from contextlib import closing
+from typing import Iterable, Optional
 
 import pandas as pd
 from scipy import stats
 
 from scraper.infrastructure.scrapers.config import SCRAPER_PATH
+from scraper.infrastructure.scrapers.deduplication import (NearDuplicateIndex,
+                                                           assign_clusters)
 from scraper.domain.rentals.entities import Rental, Apartment
 
+_SURFACE = r'(\d+(?:[.,]\d+)?)\s*(?:m2|m²|mts2?|metros(?:\s+cuadrados)?)'
+TEXT_PATTERNS = {
+    'rooms': [
+        re.compile(r'\b(\d{1,2})\s*(?:ambientes?|amb\b)'),
+        re.compile(r'\b(mono)ambientes?\b')
+    ],
+    'covered_surface': [
+        re.compile(rf'{_SURFACE}\.?\s*(?:cubiertos?|cub\b)')
+    ],
+    'total_surface': [
+        re.compile(rf'{_SURFACE}\.?\s*(?:totales?|tot\b)'),
+        re.compile(rf'superficie\s+total:?\s*(?:de\s+)?{_SURFACE}')
+    ],
+    'expenses': [
+        re.compile(r'expensas?\s*(?:de|:)?\s*\$\s*(\d[\d.]*)')
+    ]
+}
+TEXT_BOUNDS = {'rooms': (1, 10),
+               'covered_surface': (10, 1_000),
+               'total_surface': (10, 1_000),
+               'expenses': (1, 1_000_000)}
+
 
 def postprocess(data: pd.DataFrame) -> pd.DataFrame:
-    return (data.pipe(drop_nan_prices)
+    priced = drop_nan_prices(data)
+    release_representatives(set(data['link']) - set(priced['link']))
+    return (priced.pipe(backfill_from_text)
                 .pipe(drop_duplicates)
                 .pipe(add_has_balcony)
                 .pipe(add_has_terrace)
@@ -39,9 +68,66 @@ def drop_nan_prices(data: pd.DataFrame) -> pd.DataFrame:
     return data.dropna(subset=['price'])
 
 
+def backfill_from_text(data: pd.DataFrame) -> pd.DataFrame:
+    """Fills missing rooms, surfaces and expenses with the values
+    mentioned in the title or description, such as `3 ambientes`,
+    `45 m2 cubiertos` or `expensas $ 5.000`. The names of the inferred
+    fields are recorded in `inferred_fields`."""
+    data = data.copy()
+    text = (data['title'].fillna('') + ' ' +
+            data['description'].fillna('')).str.lower()
+    inferred = pd.Series('', index=data.index)
+    for field, patterns in TEXT_PATTERNS.items():
+        values = pd.Series(float('nan'), index=data.index)
+        for pattern in patterns:
+            matches = text.str.extract(pattern, expand=False)
+            values = values.fillna(_parse_numbers(matches))
+        low, high = TEXT_BOUNDS[field]
+        values = values.where(values.between(low, high))
+        mask = data[field].isna() & values.notna()
+        data[field] = data[field].where(~mask, values)
+        inferred[mask] += f'{field},'
+    data.loc[:, 'inferred_fields'] = inferred.str.rstrip(',')
+    return data
+
+
+def _parse_numbers(matches: pd.Series) -> pd.Series:
+    """Parses numbers such as `1.200`, `45,5` or `mono` (one)."""
+    numbers = (matches.str.replace('mono', '1', regex=False)
+                      .str.replace(r'\.(?=\d{3}\b)', '', regex=True)
+                      .str.replace(',', '.', regex=False))
+    return pd.to_numeric(numbers, errors='coerce').round()
+
+
 def drop_duplicates(data: pd.DataFrame) -> pd.DataFrame:
+    """Drops near-duplicate listings, keeping one representative per
+    cluster. A listing is kept unless another listing of its cluster was
+    kept since the last full crawl started, in this batch or an earlier
+    one, so representatives are always listings that are saved. The
+    cluster of each listing is kept in `cluster_id`."""
     data = data.copy()
-    return data.drop_duplicates('location')
+    with closing(NearDuplicateIndex()) as index:
+        data.loc[:, 'cluster_id'] = assign_clusters(data, index)
+        keep = data['link'].map(index.claim).astype(bool)
+    return data.loc[keep]
+
+
+def release_representatives(links: Optional[Iterable[str]] = None) -> None:
+    """Stops keeping the listings, or every listing when `links` isn't
+    given, as representatives of their clusters. Full crawls release
+    every listing when they start, so representatives are chosen among
+    the listings they scrape, and listings that are no longer saved,
+    such as the ones whose price is missing, release their cluster."""
+    with closing(NearDuplicateIndex()) as index:
+        index.release(links)
+
+
+def forget_delisted(links: Iterable[str]) -> int:
+    """Evicts the listings that aren't in `links`, which are no longer
+    listed, from the near-duplicate index and returns how many were
+    evicted."""
+    with closing(NearDuplicateIndex()) as index:
+        return index.retain(links)
 
 
 def add_has_balcony(data: pd.DataFrame) -> pd.DataFrame:
@@ -131,5 +217,9 @@ def unmarshal_row(row: dict) -> Rental:
                     row['price'],
                     row['expenses'],
                     row['link'],
-                    apartment)
+                    apartment,
+                    row.get('estimated_price'),
+                    row.get('price_gap'),
+                    row.get('inferred_fields') or '',
+                    row.get('cluster_id'))
     return rental
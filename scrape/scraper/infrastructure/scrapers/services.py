@@ -1,60 +1,184 @@
 import json
-import os
+import logging
+import multiprocessing
+import queue
 import re
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import pandas as pd
 from scraper.domain.rentals.entities import Rental
-from scraper.domain.scraping.services import ScrapingService
+from scraper.domain.scraping.services import (RecrawlableScrapingService,
+                                              RecrawlResult)
 from scraper.infrastructure.scrapers.config import SCRAPER_PATH
-from scraper.infrastructure.scrapers.postprocessing import (postprocess,
-                                                            unmarshal_row)
+from scraper.infrastructure.scrapers.postprocessing import (
+    forget_delisted,
+    postprocess,
+    release_representatives,
+    unmarshal_row
+)
 from scraper.infrastructure.scrapers.utils import normalize_html_string
-from scraper.infrastructure.scrapers.zonaprop.spiders import ZonapropSpider
+from scraper.infrastructure.scrapers.portals.spiders import (
+    DELISTED_STATUSES,
+    PortalSpider
+)
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
 from selenium.webdriver import Chrome
 
+logger = logging.getLogger(__name__)
 
-class ScrapyScraper(ScrapingService):
-    def __init__(self) -> None:
-        self._spider_classes = [ZonapropSpider]
+
+class ScrapyScraper(RecrawlableScrapingService):
+    def __init__(self, parser_processes: int = 0) -> None:
+        self._spider_classes = [PortalSpider]
+        self._parser_processes = parser_processes
 
     def scrape_for_rentals(self) -> List[Rental]:
         """Scrape for rentals."""
+        release_representatives()
         self._run_scrapers()
         data = self._read_data()
-        data = postprocess(data)
-        data = data.to_dict(orient='records')
-        return [unmarshal_row(row) for row in data]
+        if data.empty:
+            return []
+        forget_delisted(data['link'])
+        return self._to_rentals(data)
+
+    def iter_rentals(self, batch_size: int = 50) -> Iterator[List[Rental]]:
+        """Scrape for rentals, yielding each batch as soon as its postings
+        are scraped while the crawl goes on."""
+        release_representatives()
+        links = []
+        batch = []
+        for item in self._stream_items():
+            links.append(item['link'])
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield self._to_rentals(pd.DataFrame.from_records(batch))
+                batch = []
+        if batch:
+            yield self._to_rentals(pd.DataFrame.from_records(batch))
+        forget_delisted(links)
+
+    def discover_links(self, pages: int = 1) -> List[str]:
+        """Returns the links of the postings in the first `pages` result
+        pages, newest first."""
+        self._run_scrapers(discover_pages=pages)
+        data = self._read_data()
+        return [] if data.empty else data['link'].tolist()
+
+    def scrape_postings(self, links: List[str]) -> RecrawlResult:
+        """Scrape the rentals of the given postings. Postings that failed
+        to download are missing from the result."""
+        self._run_scrapers(links=links)
+        data = self._read_data()
+        if data.empty:
+            return RecrawlResult()
+        if 'delisted' not in data:
+            data['delisted'] = False
+        delisted = data['delisted'].fillna(False).astype(bool)
+        scraped = data.loc[~delisted].drop(columns='delisted')
+        return RecrawlResult(
+            [] if scraped.empty else self._to_rentals(scraped),
+            scraped['link'].tolist(),
+            data.loc[delisted, 'link'].tolist()
+        )
+
+    def retain_postings(self, links: List[str]) -> None:
+        """Forgets what's kept about the postings that aren't in `links`,
+        which are no longer listed."""
+        forget_delisted(links)
+
+    def _run_scrapers(self, **spider_kwargs) -> None:
+        """Run the spiders in a child process, since the twisted reactor
+        can't be restarted within the same process."""
+        process = multiprocessing.get_context('spawn').Process(
+            target=_crawl,
+            args=(self._spider_classes,
+                  {'PARSER_PROCESSES': self._parser_processes},
+                  spider_kwargs)
+        )
+        process.start()
+        process.join()
+        if process.exitcode:
+            raise RuntimeError(f'Crawl failed with exit code '
+                               f'{process.exitcode}')
 
-    def _run_scrapers(self) -> pd.DataFrame:
-        """Run the scraper and return the results as a pandas
-        dataframe."""
-        process = CrawlerProcess()
-        for spider in self._spider_classes:
-            process.crawl(spider)
+    def _stream_items(self) -> Iterator[dict]:
+        """Runs a full crawl in a child process, yielding its items as
+        they're scraped."""
+        context = multiprocessing.get_context('spawn')
+        items = context.Queue()
+        process = context.Process(
+            target=_crawl,
+            args=(self._spider_classes,
+                  {'PARSER_PROCESSES': self._parser_processes},
+                  {},
+                  items)
+        )
         process.start()
-        process.stop()
+        while True:
+            try:
+                item = items.get(timeout=1)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                break
+            if item is None:
+                break
+            yield item
+        process.join()
+        if process.exitcode:
+            raise RuntimeError(f'Crawl failed with exit code '
+                               f'{process.exitcode}')
 
     def _read_data(self) -> pd.DataFrame:
         files = [
-            f'{SCRAPER_PATH}/{file}'
-            for file in os.listdir(SCRAPER_PATH) if file.endswith('json')
+            f'{SCRAPER_PATH}/{spider.name}_data.json'
+            for spider in self._spider_classes
         ]
         return pd.concat([
             pd.DataFrame.from_records(json.load(open(file, 'r')))
             for file in files
         ])
 
+    def _to_rentals(self, data: pd.DataFrame) -> List[Rental]:
+        data = postprocess(data)
+        data = data.to_dict(orient='records')
+        return [unmarshal_row(row) for row in data]
+
 
-class SeleniumScraper(ScrapingService):
+def _crawl(
+    spider_classes,
+    settings: dict,
+    spider_kwargs: dict,
+    items: Optional[multiprocessing.Queue] = None
+) -> None:
+    """Runs the spiders. With `items`, every scraped item is put in it as
+    it's scraped, followed by None once the crawl is done."""
+    process = CrawlerProcess(settings)
+    for spider in spider_classes:
+        crawler = process.create_crawler(spider)
+        if items is not None:
+            crawler.signals.connect(lambda item: items.put(dict(item)),
+                                    signal=signals.item_scraped,
+                                    weak=False)
+        process.crawl(crawler, **spider_kwargs)
+    process.start()
+    if items is not None:
+        items.put(None)
+
+
+class SeleniumScraper(RecrawlableScrapingService):
     def __init__(self):
         self.base_url = 'https://www.zonaprop.com.ar'
         self.endpoint = '/departamentos-alquiler-nueva-cordoba'
+        self.newest_endpoint = f'{self.endpoint}-orden-publicado-descendente'
         self.driver = Chrome()
 
     def scrape_for_rentals(self) -> List[Rental]:
         links = self._scrape_for_links()
+        forget_delisted(links)
+        release_representatives()
         records = []
         for link in links:
             records.append(self._scrape_rental(link))
@@ -63,11 +187,61 @@ class SeleniumScraper(ScrapingService):
         return [unmarshal_row(row)
                 for row in rentals.to_dict(orient='records')]
 
-    def _scrape_for_links(self) -> List[str]:
+    def iter_rentals(self, batch_size: int = 50) -> Iterator[List[Rental]]:
+        """Scrape for rentals, yielding each batch as soon as it's
+        scraped."""
+        links = self._scrape_for_links()
+        forget_delisted(links)
+        release_representatives()
+        for start in range(0, len(links), batch_size):
+            records = [self._scrape_rental(link)
+                       for link in links[start:start + batch_size]]
+            rentals = postprocess(pd.DataFrame.from_records(records))
+            yield [unmarshal_row(row)
+                   for row in rentals.to_dict(orient='records')]
+
+    def discover_links(self, pages: int = 1) -> List[str]:
+        """Returns the links of the postings in the first `pages` result
+        pages, newest first."""
+        return self._scrape_for_links(self.newest_endpoint, pages)
+
+    def scrape_postings(self, links: List[str]) -> RecrawlResult:
+        """Scrape the rentals of the given postings. Postings that fail to
+        load are missing from the result."""
+        result = RecrawlResult()
+        records = []
+        for link in links:
+            self.driver.delete_all_cookies()
+            self.driver.get(link)
+            if self._response_status() in DELISTED_STATUSES:
+                result.delisted.append(link)
+                continue
+            try:
+                records.append(self._scrape_rental(link, load=False))
+            except Exception:
+                logger.exception('Failed to scrape %s', link)
+                continue
+            result.scraped.append(link)
+        if records:
+            rentals = postprocess(pd.DataFrame.from_records(records))
+            result.rentals = [unmarshal_row(row)
+                              for row in rentals.to_dict(orient='records')]
+        return result
+
+    def retain_postings(self, links: List[str]) -> None:
+        """Forgets what's kept about the postings that aren't in `links`,
+        which are no longer listed."""
+        forget_delisted(links)
+
+    def _scrape_for_links(
+        self,
+        endpoint: Optional[str] = None,
+        max_pages: Optional[int] = None
+    ) -> List[str]:
         page = 1
         links = []
-        while True:
-            url = f'{self.base_url}{self.endpoint}'
+        while max_pages is None or page <= max_pages:
+            url = f'{self.base_url}{endpoint or self.endpoint}'
             if page != 1:
                 url += f'-pagina-{page}'
             url += '.html'
@@ -89,9 +263,10 @@ class SeleniumScraper(ScrapingService):
             self.driver.delete_all_cookies()
         return links
 
-    def _scrape_rental(self, link) -> dict:
-        self.driver.delete_all_cookies()
-        self.driver.get(link)
+    def _scrape_rental(self, link, load: bool = True) -> dict:
+        if load:
+            self.driver.delete_all_cookies()
+            self.driver.get(link)
         title = self._scrape_title()
         description = self._scrape_description()
         extras = self._scrape_extras()
@@ -112,6 +287,13 @@ class SeleniumScraper(ScrapingService):
                 'covered_surface': covered_surface,
                 'rooms': rooms}
 
+    def _response_status(self) -> Optional[int]:
+        """Status of the loaded page, if the browser exposes it."""
+        return self.driver.execute_script(
+            "const entries = performance.getEntriesByType('navigation');"
+            'return entries.length ? entries[0].responseStatus : null;'
+        )
+
     def _scrape_title(self) -> str:
         xpath = (
             '//section[contains(@class, "article-section-description")]//h1'
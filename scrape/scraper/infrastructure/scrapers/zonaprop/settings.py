@@ -48,12 +48,6 @@ COOKIES_ENABLED = False
 #    'zonaprop.middlewares.ZonapropSpiderMiddleware': 543,
 #}
 
-# Enable or disable downloader middlewares
-# See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-DOWNLOADER_MIDDLEWARES = {
-   'zonaprop.middlewares.ZonapropDownloaderMiddleware': 543,
-}
-
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from typing import List
+
+from scraper.domain.rentals.entities import Apartment, Rental, SpoolEntry
+from scraper.domain.rentals.repositories import Spool
+
+
+class SQLiteSpool(Spool):
+    """Spool kept in a SQLite database in WAL mode. Appends are committed
+    before returning, so they survive crashes of the process."""
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=FULL')
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS spool (
+                sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                end_of_run INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                scraped_at TEXT NOT NULL
+            )"""
+        )
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS dead_letters (
+                sequence INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                end_of_run INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                scraped_at TEXT NOT NULL,
+                error TEXT NOT NULL,
+                failed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )"""
+        )
+        self._connection.commit()
+
+    def append(
+        self,
+        run_id: str,
+        rentals: List[Rental],
+        scraped_at: datetime
+    ) -> None:
+        """Durably appends a batch of rentals scraped in a run at
+        `scraped_at`."""
+        payload = json.dumps([asdict(rental) for rental in rentals])
+        self._insert(run_id, False, payload, scraped_at)
+
+    def close_run(
+        self,
+        run_id: str,
+        posting_ids: List[str],
+        closed_at: datetime
+    ) -> None:
+        """Appends the marker of the end of a run with the posting IDs of
+        every rental scraped in it."""
+        self._insert(run_id, True, json.dumps(posting_ids), closed_at)
+
+    def peek(self, limit: int) -> List[SpoolEntry]:
+        """Returns the oldest entries, without removing them."""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT sequence, run_id, end_of_run, payload, scraped_at '
+                'FROM spool ORDER BY sequence LIMIT ?',
+                (limit,)
+            ).fetchall()
+        return [self._to_entry(*row) for row in rows]
+
+    def ack(self, sequence: int) -> None:
+        """Removes the entries up to `sequence` once they're saved."""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM spool WHERE sequence <= ?',
+                                     (sequence,))
+
+    def dead_letter(self, entry: SpoolEntry, error: str) -> None:
+        """Keeps a copy of an entry that can't be saved, along with the
+        error, so it can be inspected once it's acknowledged."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO dead_letters '
+                '(sequence, run_id, end_of_run, payload, scraped_at, error) '
+                'SELECT sequence, run_id, end_of_run, payload, scraped_at, ? '
+                'FROM spool WHERE sequence = ?',
+                (error, entry.sequence)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM spool'
+            ).fetchone()[0]
+
+    def _insert(
+        self,
+        run_id: str,
+        end_of_run: bool,
+        payload: str,
+        scraped_at: datetime
+    ) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT INTO spool (run_id, end_of_run, payload, scraped_at) '
+                'VALUES (?, ?, ?, ?)',
+                (run_id, int(end_of_run), payload, scraped_at.isoformat())
+            )
+
+    def _to_entry(
+        self,
+        sequence: int,
+        run_id: str,
+        end_of_run: int,
+        payload: str,
+        scraped_at: str
+    ) -> SpoolEntry:
+        scraped_at = datetime.fromisoformat(scraped_at)
+        if end_of_run:
+            return SpoolEntry(sequence, run_id, [], scraped_at, True,
+                              json.loads(payload))
+        rentals = [Rental(**{**rental,
+                             'apartment': Apartment(**rental['apartment'])})
+                   for rental in json.loads(payload)]
+        return SpoolEntry(sequence, run_id, rentals, scraped_at)
@@ -0,0 +1,145 @@
+from dataclasses import dataclass
+from typing import List
+
+from scraper.infrastructure.db.client import DatabaseClient
+
+
+@dataclass
+class Migration:
+    """Schema change. MySQL commits every DDL statement on its own, so
+    each statement must be safe to run again, otherwise a failed
+    migration couldn't be retried. Changes to a table are made in a
+    single ALTER TABLE along with its indexes."""
+    version: int
+    name: str
+    statements: List[str]
+
+
+MIGRATIONS = [
+    Migration(1, 'create_rentals', [
+        """CREATE TABLE IF NOT EXISTS `rentals` (
+            `location` TEXT,
+            `total_surface` DOUBLE,
+            `covered_surface` DOUBLE,
+            `has_balcony` DOUBLE,
+            `has_terrace` DOUBLE,
+            `has_garage` DOUBLE,
+            `is_studio_apartment` DOUBLE,
+            `rooms` DOUBLE,
+            `extras` TEXT,
+            `title` TEXT,
+            `description` TEXT,
+            `price` DOUBLE,
+            `expenses` DOUBLE,
+            `link` TEXT
+        )"""
+    ]),
+    Migration(2, 'type_and_index_rentals', [
+        """ALTER TABLE `rentals`
+            ADD COLUMN `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT
+                PRIMARY KEY FIRST,
+            MODIFY `total_surface` INT UNSIGNED,
+            MODIFY `covered_surface` INT UNSIGNED,
+            MODIFY `has_balcony` TINYINT(1) NOT NULL DEFAULT 0,
+            MODIFY `has_terrace` TINYINT(1) NOT NULL DEFAULT 0,
+            MODIFY `has_garage` TINYINT(1) NOT NULL DEFAULT 0,
+            MODIFY `is_studio_apartment` TINYINT(1) NOT NULL DEFAULT 0,
+            MODIFY `rooms` TINYINT UNSIGNED,
+            MODIFY `extras` JSON,
+            MODIFY `description` TEXT,
+            MODIFY `price` DOUBLE NOT NULL,
+            MODIFY `expenses` DOUBLE,
+            MODIFY `link` VARCHAR(512) NOT NULL,
+            ADD INDEX `idx_rentals_price` (`price`),
+            ADD INDEX `idx_rentals_rooms_price` (`rooms`, `price`),
+            ADD INDEX `idx_rentals_surface_price` (`total_surface`, `price`),
+            ADD INDEX `idx_rentals_amenities_price` (`has_balcony`,
+                                                     `has_terrace`,
+                                                     `has_garage`,
+                                                     `is_studio_apartment`,
+                                                     `price`)"""
+    ]),
+    Migration(3, 'add_rentals_price_estimates', [
+        """ALTER TABLE `rentals`
+            ADD COLUMN `estimated_price` DOUBLE,
+            ADD COLUMN `price_gap` DOUBLE,
+            ADD INDEX `idx_rentals_price_gap` (`price_gap`)"""
+    ]),
+    Migration(4, 'create_price_history', [
+        """CREATE TABLE IF NOT EXISTS `price_history` (
+            `posting_id` VARCHAR(128) NOT NULL,
+            `observed_at` DATETIME NOT NULL,
+            `price` DOUBLE,
+            `expenses` DOUBLE,
+            PRIMARY KEY (`posting_id`, `observed_at`)
+        )
+        PARTITION BY RANGE COLUMNS (`observed_at`) (
+            PARTITION `p_future` VALUES LESS THAN (MAXVALUE)
+        )""",
+        """CREATE TABLE IF NOT EXISTS `price_latest` (
+            `posting_id` VARCHAR(128) NOT NULL PRIMARY KEY,
+            `observed_at` DATETIME NOT NULL,
+            `price` DOUBLE,
+            `expenses` DOUBLE
+        )""",
+        *[f"""CREATE TABLE IF NOT EXISTS `price_aggregates_{granularity}` (
+            `period_start` DATE NOT NULL,
+            `dimension` VARCHAR(32) NOT NULL,
+            `value` VARCHAR(255) NOT NULL,
+            `median_price` DOUBLE NOT NULL,
+            `listings` INT UNSIGNED NOT NULL,
+            PRIMARY KEY (`dimension`, `value`, `period_start`)
+        )""" for granularity in ('daily', 'weekly')]
+    ]),
+    Migration(5, 'add_rentals_posting_id', [
+        """ALTER TABLE `rentals`
+            ADD COLUMN `posting_id` VARCHAR(128) AFTER `id`,
+            ADD UNIQUE INDEX `idx_rentals_posting_id` (`posting_id`)"""
+    ]),
+    Migration(6, 'add_rentals_inferred_fields', [
+        """ALTER TABLE `rentals`
+            ADD COLUMN `inferred_fields` VARCHAR(128) NOT NULL DEFAULT ''"""
+    ]),
+    Migration(7, 'add_rentals_cluster_id', [
+        """ALTER TABLE `rentals`
+            ADD COLUMN `cluster_id` VARCHAR(512),
+            ADD INDEX `idx_rentals_cluster_id` (`cluster_id`)"""
+    ]),
+]
+
+
+class Migrator:
+    """Applies the pending migrations, recording each applied version in
+    the `schema_migrations` table."""
+
+    def __init__(
+        self,
+        client: DatabaseClient,
+        migrations: List[Migration] = MIGRATIONS
+    ) -> None:
+        self._client = client
+        self._migrations = sorted(migrations, key=lambda m: m.version)
+
+    def migrate(self) -> List[Migration]:
+        """Applies the pending migrations and returns them."""
+        self._client.execute(
+            """CREATE TABLE IF NOT EXISTS `schema_migrations` (
+                `version` INT UNSIGNED NOT NULL PRIMARY KEY,
+                `name` VARCHAR(255) NOT NULL,
+                `applied_at` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )"""
+        )
+        applied = {
+            row['version'] for row in
+            self._client.fetch_all('SELECT `version` FROM schema_migrations')
+        }
+        pending = [m for m in self._migrations if m.version not in applied]
+        for migration in pending:
+            for statement in migration.statements:
+                self._client.execute(statement)
+            self._client.execute(
+                'INSERT INTO `schema_migrations` (`version`, `name`) '
+                'VALUES (%s, %s)',
+                (migration.version, migration.name)
+            )
+        return pending
@@ -0,0 +1,218 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from scraper.domain.rentals.entities import PriceAggregate, Rental
+from scraper.domain.rentals.repositories import HistoryRepository
+from scraper.infrastructure.db.mysql import MySQLClient
+
+GRANULARITIES = {'daily': 'price_aggregates_daily',
+                 'weekly': 'price_aggregates_weekly'}
+DIMENSIONS = ['rooms',
+              'has_balcony',
+              'has_terrace',
+              'has_garage',
+              'is_studio_apartment',
+              'area']
+LOOKUP_CHUNK_SIZE = 1_000
+
+
+class PriceHistoryRepository(HistoryRepository):
+    """Keeps the price history of every posting in `price_history`, which
+    is partitioned by month and only gets a row when the price or the
+    expenses of a posting change. The last known values are kept in
+    `price_latest` so changes are detected without reading the history.
+    """
+
+    def __init__(self, client: MySQLClient) -> None:
+        self._client = client
+
+    def record(self, rentals: List[Rental], observed_at: datetime) -> int:
+        """Appends the price and expenses of the rentals whose values
+        changed since they were last recorded and returns how many
+        changed."""
+        values = {rental.posting_id: (_nullable(rental.price),
+                                      _nullable(rental.expenses))
+                  for rental in rentals}
+        latest = self._latest_values(list(values))
+        changes = [(posting_id, observed_at, *value)
+                   for posting_id, value in values.items()
+                   if latest.get(posting_id) != value]
+        if not changes:
+            return 0
+
+        self._ensure_partition(observed_at)
+        placeholders = ', '.join(['(%s, %s, %s, %s)'] * len(changes))
+        args = [value for change in changes for value in change]
+        self._client.execute(
+            'INSERT IGNORE INTO `price_history` '
+            '(`posting_id`, `observed_at`, `price`, `expenses`) '
+            f'VALUES {placeholders}',
+            args
+        )
+        self._client.execute(
+            'INSERT INTO `price_latest` '
+            '(`posting_id`, `observed_at`, `price`, `expenses`) '
+            f'VALUES {placeholders} '
+            'ON DUPLICATE KEY UPDATE '
+            '`observed_at` = VALUES(`observed_at`), '
+            '`price` = VALUES(`price`), '
+            '`expenses` = VALUES(`expenses`)',
+            args
+        )
+        return len(changes)
+
+    def refresh_aggregates(
+        self,
+        rentals: List[Rental],
+        observed_at: datetime
+    ) -> None:
+        """Updates the daily and weekly aggregates of the period
+        containing `observed_at` with the given snapshot of rentals.
+
+        The day is aggregated from its last snapshot, replacing its rows
+        so values that are no longer listed are dropped. The week is then
+        recomputed from its daily rows: its median is the median of the
+        daily medians weighted by their listings, and its listings are
+        the average listings per day."""
+        if not rentals:
+            return
+
+        data = _to_frame(rentals)
+        day = observed_at.date()
+        self._replace_aggregates('daily', day, [
+            (day, dimension, str(value),
+             float(group.median()), int(group.count()))
+            for dimension in DIMENSIONS
+            for value, group in data.groupby(dimension)['price']
+        ])
+
+        week_start = day - timedelta(days=day.weekday())
+        daily = pd.DataFrame.from_records(self._client.fetch_all(
+            'SELECT `dimension`, `value`, `median_price`, `listings` '
+            f'FROM `{GRANULARITIES["daily"]}` '
+            'WHERE `period_start` BETWEEN %s AND %s',
+            (week_start, week_start + timedelta(days=6))
+        ))
+        self._replace_aggregates('weekly', week_start, [
+            (week_start, dimension, value,
+             _weighted_median(group['median_price'], group['listings']),
+             int(round(group['listings'].mean())))
+            for (dimension, value), group
+            in daily.groupby(['dimension', 'value'])
+        ])
+
+    def aggregates(
+        self,
+        granularity: str,
+        dimension: str,
+        since: Optional[date] = None
+    ) -> List[PriceAggregate]:
+        """Returns the `daily` or `weekly` aggregates of a dimension."""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'Unknown granularity {granularity}')
+
+        query = ('SELECT `period_start`, `dimension`, `value`, '
+                 '`median_price`, `listings` '
+                 f'FROM `{GRANULARITIES[granularity]}` '
+                 'WHERE `dimension` = %s AND `period_start` >= %s '
+                 'ORDER BY `period_start`, `value`')
+        rows = self._client.fetch_all(query, (dimension,
+                                              since or date.min))
+        return [PriceAggregate(**row) for row in rows]
+
+    def _replace_aggregates(
+        self,
+        granularity: str,
+        period_start: date,
+        rows: List[tuple]
+    ) -> None:
+        table = GRANULARITIES[granularity]
+        self._client.execute(
+            f'DELETE FROM `{table}` WHERE `period_start` = %s',
+            (period_start,)
+        )
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+        self._client.execute(
+            f'INSERT INTO `{table}` '
+            '(`period_start`, `dimension`, `value`, '
+            '`median_price`, `listings`) '
+            f'VALUES {placeholders}',
+            [value for row in rows for value in row]
+        )
+
+    def _latest_values(
+        self,
+        posting_ids: List[str]
+    ) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+        latest = {}
+        for start in range(0, len(posting_ids), LOOKUP_CHUNK_SIZE):
+            chunk = posting_ids[start:start + LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            rows = self._client.fetch_all(
+                'SELECT `posting_id`, `price`, `expenses` '
+                f'FROM `price_latest` WHERE `posting_id` IN ({placeholders})',
+                chunk
+            )
+            latest.update({row['posting_id']: (row['price'], row['expenses'])
+                           for row in rows})
+        return latest
+
+    def _ensure_partition(self, observed_at: datetime) -> None:
+        """Splits the catch-all partition so the month of `observed_at`
+        has its own partition."""
+        month = observed_at.replace(day=1).date()
+        name = f'p{month:%Y%m}'
+        existing = self._client.fetch_all(
+            'SELECT `PARTITION_NAME` AS `name` '
+            'FROM `information_schema`.`PARTITIONS` '
+            'WHERE `TABLE_SCHEMA` = DATABASE() '
+            "AND `TABLE_NAME` = 'price_history' "
+            'AND `PARTITION_NAME` = %s',
+            (name,)
+        )
+        if existing:
+            return
+
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        self._client.execute(
+            'ALTER TABLE `price_history` REORGANIZE PARTITION `p_future` '
+            f"INTO (PARTITION `{name}` VALUES LESS THAN ('{next_month}'), "
+            'PARTITION `p_future` VALUES LESS THAN (MAXVALUE))'
+        )
+
+
+def _nullable(value) -> Optional[float]:
+    if value is None or value != value:
+        return None
+    return float(value)
+
+
+def _weighted_median(values: pd.Series, weights: pd.Series) -> float:
+    order = values.argsort().to_numpy()
+    values, weights = values.to_numpy()[order], weights.to_numpy()[order]
+    cumulative = weights.cumsum()
+    return float(values[(cumulative >= cumulative[-1] / 2).argmax()])
+
+
+def _area(location: Optional[str]) -> str:
+    """Neighbourhood of a location such as `Street 123, Area, City`."""
+    parts = [part.strip() for part in (location or '').split(',')]
+    parts = [part for part in parts if part]
+    if len(parts) >= 3:
+        return parts[-2].capitalize()
+    return parts[-1].capitalize() if parts else 'Unknown'
+
+
+def _to_frame(rentals: List[Rental]) -> pd.DataFrame:
+    return pd.DataFrame.from_records([
+        {'price': rental.price,
+         'rooms': rental.apartment.rooms,
+         'has_balcony': bool(rental.apartment.has_balcony),
+         'has_terrace': bool(rental.apartment.has_terrace),
+         'has_garage': bool(rental.apartment.has_garage),
+         'is_studio_apartment': bool(rental.apartment.is_studio_apartment),
+         'area': _area(rental.apartment.location)}
+        for rental in rentals
+    ]).astype({'rooms': 'Int64'})
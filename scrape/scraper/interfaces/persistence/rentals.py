@@ -1,29 +1,118 @@
-from typing import List, Union
+from typing import List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from scraper.domain.rentals.entities import Rental
-from scraper.domain.rentals.repositories import Repository
+from scraper.domain.rentals.repositories import Repository, RentalsQuery
 from scraper.infrastructure.db.mysql import MySQLClient
+from scraper.infrastructure.scrapers.postprocessing import unmarshal_row
+
+RENTALS_SCHEMA = pa.schema([
+    ('id', pa.uint64()),
+    ('posting_id', pa.string()),
+    ('location', pa.string()),
+    ('total_surface', pa.uint32()),
+    ('covered_surface', pa.uint32()),
+    ('has_balcony', pa.bool_()),
+    ('has_terrace', pa.bool_()),
+    ('has_garage', pa.bool_()),
+    ('is_studio_apartment', pa.bool_()),
+    ('rooms', pa.uint8()),
+    ('extras', pa.string()),
+    ('title', pa.string()),
+    ('description', pa.string()),
+    ('price', pa.float64()),
+    ('expenses', pa.float64()),
+    ('link', pa.string()),
+    ('estimated_price', pa.float64()),
+    ('price_gap', pa.float64()),
+    ('inferred_fields', pa.string()),
+    ('cluster_id', pa.string())
+])
 
 
 class QueryBuilder:
-    def make_insert(self, rentals: List[Rental]) -> str:
+    def make_insert(self, rentals: List[Rental]) -> Tuple[str, list]:
         columns = self._rentals_to_columns(rentals)
-        values = self._rentals_to_values(rentals)
-        query = f'INSERT INTO `scraper`.`rentals`{columns} VALUES {values}'
-        return query.replace('nan', 'NULL')
+        placeholders, args = self._rentals_to_values(rentals)
+        updates = ', '.join(f'`{col}` = VALUES(`{col}`)'
+                            for col in self._rental_to_dict(rentals[0])
+                            if col != 'posting_id')
+        query = (f'INSERT INTO `scraper`.`rentals`{columns} '
+                 f'VALUES {placeholders} '
+                 f'ON DUPLICATE KEY UPDATE {updates}')
+        return query, args
+
+    def make_retain(self, posting_ids: List[str]) -> Tuple[str, list]:
+        placeholders = ', '.join(['%s'] * len(posting_ids))
+        query = ('DELETE FROM `scraper`.`rentals` '
+                 'WHERE `posting_id` IS NULL '
+                 f'OR `posting_id` NOT IN ({placeholders})')
+        return query, list(posting_ids)
+
+    def make_select(
+        self,
+        query: RentalsQuery,
+        columns: Optional[List[str]] = None
+    ) -> Tuple[str, list]:
+        if query.order_by not in RENTALS_SCHEMA.names:
+            raise ValueError(f'Can\'t order by {query.order_by}')
+
+        conditions, args = [], []
+        ranges = [('price', query.min_price, query.max_price),
+                  ('price_gap', query.min_price_gap, None),
+                  ('rooms', query.min_rooms, query.max_rooms),
+                  ('total_surface', query.min_surface, query.max_surface)]
+        for column, low, high in ranges:
+            if low is not None:
+                conditions.append(f'`{column}` >= %s')
+                args.append(low)
+            if high is not None:
+                conditions.append(f'`{column}` <= %s')
+                args.append(high)
+
+        flags = [('has_balcony', query.has_balcony),
+                 ('has_terrace', query.has_terrace),
+                 ('has_garage', query.has_garage),
+                 ('is_studio_apartment', query.is_studio_apartment)]
+        for column, value in flags:
+            if value is not None:
+                conditions.append(f'`{column}` = %s')
+                args.append(int(value))
+
+        if query.posting_ids is not None:
+            placeholders = ', '.join(['%s'] * len(query.posting_ids))
+            conditions.append(f'`posting_id` IN ({placeholders or "NULL"})')
+            args += query.posting_ids
+
+        columns = ', '.join(f'`{col}`' for col in columns) if columns else '*'
+        sql = f'SELECT {columns} FROM `scraper`.`rentals`'
+        if conditions:
+            sql += f' WHERE {" AND ".join(conditions)}'
+        sql += f' ORDER BY `{query.order_by}`'
+        if query.limit is not None:
+            sql += ' LIMIT %s'
+            args.append(query.limit)
+        return sql, args
 
     def _rental_to_dict(self, rental: Rental) -> dict:
         apartment_dict = rental.__dict__['apartment'].__dict__
         rental_dict = rental.__dict__
         return {
-            k: v for k, v in {**apartment_dict, **rental_dict}.items()
-            if k != 'apartment'
+            'posting_id': rental.posting_id,
+            **{k: v for k, v in {**apartment_dict, **rental_dict}.items()
+               if k != 'apartment'}
         }
 
-    def _rentals_to_values(self, rentals: List[Rental]) -> str:
-        values = [str(tuple(self._rental_to_dict(rental).values()))
-                  for rental in rentals]
-        return ', '.join(values)
+    def _rentals_to_values(self, rentals: List[Rental]) -> Tuple[str, list]:
+        rows = [list(self._rental_to_dict(rental).values())
+                for rental in rentals]
+        row_placeholders = f'({", ".join(["%s"] * len(rows[0]))})'
+        placeholders = ', '.join([row_placeholders] * len(rows))
+        args = [None if value != value else value
+                for row in rows for value in row]
+        return placeholders, args
 
     def _rentals_to_columns(self, rentals: List[Rental]) -> str:
         return f"""(
@@ -42,8 +131,50 @@ class RentalsRepository(Repository):
         if not isinstance(rentals, list):
             rentals = [rentals]
 
-        query = self._query_builder.make_insert(rentals)
-        self._client.execute(query)
+        if not rentals:
+            return
+
+        query, args = self._query_builder.make_insert(rentals)
+        self._client.execute(query, args)
+
+    def find(self, query: Optional[RentalsQuery] = None) -> List[Rental]:
+        """Returns the rentals matching the query."""
+        sql, args = self._query_builder.make_select(query or RentalsQuery())
+        return [unmarshal_row(row)
+                for row in self._client.fetch_all(sql, args)]
+
+    def find_links(self, query: Optional[RentalsQuery] = None) -> List[str]:
+        """Returns the links of the rentals matching the query."""
+        sql, args = self._query_builder.make_select(query or RentalsQuery(),
+                                                    ['link'])
+        return [row['link'] for row in self._client.fetch_all(sql, args)]
+
+    def export_parquet(
+        self,
+        path: str,
+        query: Optional[RentalsQuery] = None,
+        batch_size: int = 10_000
+    ) -> int:
+        """Streams the rentals matching the query into a parquet file in
+        batches of `batch_size` rows and returns the number of rows
+        written. Memory usage is bounded by the batch size."""
+        sql, args = self._query_builder.make_select(query or RentalsQuery(),
+                                                    RENTALS_SCHEMA.names)
+        written = 0
+        with pq.ParquetWriter(path, RENTALS_SCHEMA) as writer:
+            for batch in self._client.stream(sql, args, batch_size):
+                writer.write_table(pa.table(batch).cast(RENTALS_SCHEMA))
+                written += len(batch['id'])
+        return written
+
+    def retain(self, posting_ids: List[str]) -> None:
+        """Deletes the rentals whose posting ID isn't in `posting_ids`.
+        An empty `posting_ids` deletes nothing."""
+        if not posting_ids:
+            return
+
+        query, args = self._query_builder.make_retain(posting_ids)
+        self._client.execute(query, args)
 
     def truncate(self) -> None:
         """Deletes all the data."""